@@ -1,53 +1,167 @@
+import os
+
+# Skip OpenCL runtime probing; nothing here runs on an OpenCL device.
+# Must be set before cv2 is imported.
+os.environ.setdefault("OPENCV_OPENCL_RUNTIME", "disabled")
+
 import streamlit as st
 import cv2
 import pandas as pd
 import json
 from datetime import datetime
+from collections import OrderedDict
 from deepface import DeepFace
-import os
+import tensorflow as tf
+import atexit
+import threading
+import time
+import warnings
+import uuid
 import numpy as np
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Let OpenCV use its SIMD paths and all but one core for resize/color/encode
+cv2.setUseOptimized(True)
+cv2.setNumThreads(max(1, (os.cpu_count() or 1) - 1))
+
 # Paths for database and logs
 DB_PATH = "faces_db"
 os.makedirs(DB_PATH, exist_ok=True)
 JSON_FILE = "attendance.json"
+LOG_FILE = "attendance.jsonl"
+# Quantized embedding matrix, its per-row scales, and the names/version
+# metadata describing them
+EMB_FILE = "faces_emb.npy"
+SCALE_FILE = "faces_scale.npy"
+META_FILE = "faces_meta.json"
 
-def load_attendance_data():
-    """Load attendance data from JSON file"""
+# Embedding model, and the on-disk format version of the embedding files.
+# Bump EMB_VERSION whenever the model or stored layout changes.
+MODEL_NAME = "Facenet"
+EMB_VERSION = 5
+FACE_SIZE = (160, 160)
+EMBED_BATCH_SIZE = 32
+
+# Maximum euclidean distance between normalized embeddings for a match,
+# and the equivalent minimum cosine similarity (|a - b|^2 = 2 - 2cos)
+MATCH_THRESHOLD = 0.7
+COSINE_THRESHOLD = 1 - MATCH_THRESHOLD ** 2 / 2
+
+# Faces recently recognized in a session, keyed by perceptual hash of the
+# face crop; the small distance only absorbs near-identical re-verifies
+HASH_CACHE_SIZE = 128
+HASH_MAX_DISTANCE = 2
+
+# Oldest webcam frame (in seconds) a capture may return; anything older
+# means the camera stopped delivering frames
+FRAME_MAX_AGE = 0.5
+
+# Width verification frames are shown at
+DISPLAY_WIDTH = 400
+
+def dump_json(data, indent=False):
+    """Serialize data to JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None).encode()
+
+def load_json(data):
+    """Parse JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def migrate_attendance_data():
+    """Convert a legacy JSON attendance file to the append-only JSONL log"""
+    if os.path.exists(LOG_FILE) or not os.path.exists(JSON_FILE):
+        return
     try:
-        if os.path.exists(JSON_FILE):
-            with open(JSON_FILE, 'r') as file:
-                data = json.load(file)
-                return pd.DataFrame(data)
-        else:
-            return pd.DataFrame(columns=["Name", "Type", "Time"])
-    except (json.JSONDecodeError, FileNotFoundError):
-        return pd.DataFrame(columns=["Name", "Type", "Time"])
+        with open(JSON_FILE, 'r') as file:
+            data = json.load(file)
+    except (json.JSONDecodeError, OSError):
+        # An empty or unreadable legacy file has no records to carry over
+        data = []
+    if not isinstance(data, list):
+        data = []
+    try:
+        with open(LOG_FILE, 'wb') as file:
+            for record in data:
+                file.write(dump_json(record) + b"\n")
+    except OSError as e:
+        st.error(f"Error migrating {JSON_FILE}: {e}")
 
-def save_attendance_data(df):
-    """Save attendance data to JSON file"""
+@st.cache_data
+def read_attendance_log(mtime_ns, size):
+    """Parse the JSONL log into records; the file's mtime and size key the cache"""
+    records = []
     try:
-        data = df.to_dict('records')
-        with open(JSON_FILE, 'w') as file:
-            json.dump(data, file, indent=4)
-        return True
-    except Exception as e:
-        st.error(f"Error saving JSON: {e}")
-        return False
+        with open(LOG_FILE, 'rb') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(load_json(line))
+                except ValueError:
+                    # Skip a line left half-written by an interrupted append
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+@st.cache_data
+def read_attendance_frame(mtime_ns, size):
+    """Build the attendance DataFrame with parsed timestamps, cached like the records"""
+    records = read_attendance_log(mtime_ns, size)
+    if not records:
+        return pd.DataFrame(columns=["Name", "Type", "Time"])
+    df = pd.DataFrame(records)
+    
+    # The log is appended in order, so this is normally already sorted
+    # and the sort is skipped
+    if 'Time' in df.columns:
+        df['Time'] = pd.to_datetime(df['Time'], errors='coerce')
+        if not df['Time'].is_monotonic_increasing:
+            df = df.sort_values('Time', kind='stable', ignore_index=True)
+    return df
+
+def load_attendance_data():
+    """Load attendance records from JSONL log, and the DataFrame built from them"""
+    if not os.path.exists(LOG_FILE):
+        return [], pd.DataFrame(columns=["Name", "Type", "Time"])
+    stat = os.stat(LOG_FILE)
+    return (
+        read_attendance_log(stat.st_mtime_ns, stat.st_size),
+        read_attendance_frame(stat.st_mtime_ns, stat.st_size)
+    )
 
 def log_check(name, check_type):
     """Log attendance check-in/check-out"""
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    # Load existing data
-    df = load_attendance_data()
-    
-    # Add new entry
-    new_entry = pd.DataFrame([{"Name": name, "Type": check_type, "Time": now}])
-    df = pd.concat([df, new_entry], ignore_index=True)
+    # Append a single record instead of rewriting the whole log
+    try:
+        with open(LOG_FILE, 'ab') as file:
+            file.write(dump_json({"Name": name, "Type": check_type, "Time": now}) + b"\n")
+        saved = True
+        read_attendance_log.clear()
+        read_attendance_frame.clear()
+    except OSError as e:
+        st.error(f"Error saving JSONL: {e}")
+        saved = False
     
-    # Save updated data
-    if save_attendance_data(df):
+    if saved:
         st.success(f"✅ {check_type} successfully recorded for {name} at {now}")
         st.balloons()  # Celebration animation
         return True
@@ -58,46 +172,347 @@ def log_check(name, check_type):
 @st.cache_resource
 def get_webcam():
     """Get webcam with caching to avoid multiple instances"""
-    return cv2.VideoCapture(0)
+    cam = cv2.VideoCapture(0)
+    atexit.register(cam.release)
+    return cam
+
+class FrameGrabber(threading.Thread):
+    """Keep the newest webcam frame available from a background thread"""
+    
+    def __init__(self, cam):
+        super().__init__(name="FrameGrabber", daemon=True)
+        self.cam = cam
+        self.latest = None
+        self.latest_time = 0.0
+        self.lock = threading.Lock()
+        self.running = True
+        self.start()
+    
+    def run(self):
+        while self.running:
+            ret, frame = self.cam.read()
+            if not ret:
+                time.sleep(0.05)
+                continue
+            # Frames are replaced, never modified, so readers can share them
+            with self.lock:
+                self.latest = frame
+                self.latest_time = time.monotonic()
+    
+    def read(self, timeout=2.0):
+        """Return a frame at most FRAME_MAX_AGE old, or None if none arrives within timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                frame, frame_time = self.latest, self.latest_time
+            now = time.monotonic()
+            if frame is not None and now - frame_time <= FRAME_MAX_AGE:
+                return frame
+            if now >= deadline:
+                return None
+            time.sleep(0.02)
+    
+    def stop(self):
+        self.running = False
+        if self is not threading.current_thread():
+            self.join(timeout=1.0)
+        self.cam.release()
+
+@st.cache_resource
+def get_frame_grabber():
+    """Start one background frame grabber per app process"""
+    cam = get_webcam()
+    
+    # Clearing Streamlit's caches drops the previous grabber without stopping
+    # it, leaving its thread reading the old camera handle
+    for thread in threading.enumerate():
+        if thread.name == "FrameGrabber" and getattr(thread, "cam", cam) is not cam:
+            thread.stop()
+    
+    grabber = FrameGrabber(cam)
+    atexit.register(grabber.stop)
+    return grabber
+
+def reset_frame_grabber():
+    """Stop the grabber and drop the cached webcam so the next capture reopens it"""
+    get_frame_grabber().stop()
+    get_frame_grabber.clear()
+    get_webcam.clear()
+
+def quantize_embeddings(emb):
+    """Quantize normalized embeddings to int8 with one scale factor per row"""
+    scale = 127.0 / np.max(np.abs(emb), axis=-1, keepdims=True)
+    emb_q = np.round(emb * scale).astype(np.int8)
+    return emb_q, np.squeeze(scale, axis=-1).astype(np.float32)
+
+@st.cache_resource
+def get_face_model():
+    """Build the embedding model once per session"""
+    model = DeepFace.build_model(MODEL_NAME)
+    # Newer DeepFace releases wrap the Keras model in a client object
+    return getattr(model, "model", model)
+
+@st.cache_resource
+def get_embed_fn():
+    """Compile the single-face forward pass with XLA for the fixed input shape"""
+    model = get_face_model()
+    
+    @tf.function(
+        jit_compile=True,
+        input_signature=[tf.TensorSpec((1, FACE_SIZE[1], FACE_SIZE[0], 3), tf.float32)]
+    )
+    def embed(x):
+        return model(x, training=False)
+    
+    # Compile up front so a platform without XLA support is detected here
+    try:
+        embed(tf.zeros((1, FACE_SIZE[1], FACE_SIZE[0], 3), tf.float32))
+    except Exception as e:
+        # A None 'fn' sends callers to model.predict for the rest of the process
+        warnings.warn(f"XLA embedding unavailable, using model.predict: {e}")
+        return {'fn': None}
+    return {'fn': embed}
+
+@st.cache_resource
+def get_face_detector():
+    """Load the OpenCV Haar cascade used to crop faces"""
+    return cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+def crop_face(frame):
+    """Crop the largest face from a BGR frame as a model-sized RGB uint8 image"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    faces = get_face_detector().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=10)
+    
+    # Fall back to the whole frame when no face is found
+    if len(faces) > 0:
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        frame = frame[y:y + h, x:x + w]
+    
+    face = cv2.resize(frame, FACE_SIZE)
+    return cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+
+def embed_faces(faces):
+    """Compute normalized embeddings for a stack of cropped faces"""
+    faces = np.asarray(faces, dtype=np.float32) / 255.0
+    emb = None
+    embed = get_embed_fn()
+    if len(faces) == 1 and embed['fn'] is not None:
+        # Single probes and registrations take the compiled fast path
+        try:
+            emb = embed['fn'](tf.constant(faces)).numpy()
+        except Exception as e:
+            warnings.warn(f"XLA embedding failed, using model.predict: {e}")
+            embed['fn'] = None
+    if emb is None:
+        emb = get_face_model().predict(faces, batch_size=EMBED_BATCH_SIZE, verbose=0)
+    emb = emb.astype(np.float32)
+    return emb / np.linalg.norm(emb, axis=-1, keepdims=True)
+
+@st.cache_data
+def scan_registered_faces(mtime_ns):
+    """Map each registered name to its face file, preferring .npy crops"""
+    registered = {}
+    for file in sorted(os.listdir(DB_PATH)):
+        name, ext = os.path.splitext(file)
+        if ext == '.npy' or (ext == '.jpg' and name not in registered):
+            registered[name] = file
+    return dict(sorted(registered.items()))
+
+def list_registered_faces():
+    """List registered faces, rescanning DB_PATH only when its mtime changes"""
+    return scan_registered_faces(os.stat(DB_PATH).st_mtime_ns)
+
+def load_face_crop(file):
+    """Load a stored face crop, cropping legacy full-frame .jpg files on the fly"""
+    path = os.path.join(DB_PATH, file)
+    if file.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    img = cv2.imread(path)
+    if img is None:
+        raise ValueError("could not read image")
+    return crop_face(img)
+
+def replace_file(path, write):
+    """Write a file via a temp file in the same directory, then swap it in"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        write(file)
+    # A new inode replaces the old one, so live memory maps keep the old data
+    os.replace(temp_path, path)
+
+def save_embedding_db(emb_q, scale, names):
+    """Persist the quantized embedding matrix, scales and metadata; return its token"""
+    # Metadata is removed first and written last, so an interrupted save
+    # leaves no metadata and the matrix is rebuilt on the next load
+    if os.path.exists(META_FILE):
+        os.remove(META_FILE)
+    replace_file(EMB_FILE, lambda file: np.save(file, np.ascontiguousarray(emb_q)))
+    replace_file(SCALE_FILE, lambda file: np.save(file, scale))
+    # A fresh token per save lets caches tell matrices apart without
+    # holding a reference to the (memory-mapped) matrix itself
+    token = uuid.uuid4().hex
+    meta = {"version": EMB_VERSION, "token": token, "names": list(map(str, names))}
+    replace_file(META_FILE, lambda file: file.write(dump_json(meta)))
+    return token
+
+def build_embedding_db():
+    """Compute one embedding per registered face and save them as a single matrix"""
+    faces, names = [], []
+    
+    for name, file in list_registered_faces().items():
+        try:
+            faces.append(load_face_crop(file))
+            names.append(name)
+        except Exception as e:
+            st.warning(f"Embedding error with {file}: {str(e)}")
+            continue
+    
+    if faces:
+        # One batched forward pass for every registered face; rows come back
+        # unit length, so matching is a single matrix-vector product
+        emb_q, scale = quantize_embeddings(embed_faces(np.stack(faces)))
+    else:
+        emb_q = np.empty((0, 0), dtype=np.int8)
+        scale = np.empty(0, dtype=np.float32)
+    names = np.array(names)
+    
+    token = save_embedding_db(emb_q, scale, names)
+    return emb_q, scale, names, token
+
+def add_to_embedding_db(name, embedding, db):
+    """Insert or replace a single user's embedding in the stored matrix"""
+    emb_q, scale, names, _ = db
+    row_q, row_scale = quantize_embeddings(embedding)
+    
+    if len(names) == 0:
+        emb_q, scale, names = row_q[None], row_scale[None], np.array([name])
+    else:
+        keep = names != name
+        # Boolean indexing and concatenate copy the rows into memory
+        emb_q = np.concatenate([emb_q[keep], row_q[None]])
+        scale = np.concatenate([scale[keep], row_scale[None]])
+        names = np.concatenate([names[keep], [name]])
+    
+    # Drop the cached mapping so the replaced file is not held open (Windows
+    # refuses to replace a mapped file)
+    load_embedding_db.clear()
+    save_embedding_db(emb_q, scale, names)
+
+@st.cache_resource(max_entries=1)
+def load_embedding_db(registered):
+    """Load the embedding matrix for the given registered names, rebuilding it if stale"""
+    registered = list(registered)
+    
+    if os.path.exists(META_FILE):
+        try:
+            with open(META_FILE, 'rb') as file:
+                meta = load_json(file.read())
+            names = np.array(meta["names"])
+            if meta["version"] == EMB_VERSION and sorted(meta["names"]) == registered and len(names) > 0:
+                # Map the matrix instead of reading it; pages load on first touch
+                emb_q = np.asarray(np.load(EMB_FILE, mmap_mode='r'))
+                scale = np.load(SCALE_FILE)
+                if len(emb_q) == len(scale) == len(names):
+                    return emb_q, scale, names, meta["token"]
+        except (OSError, ValueError, KeyError):
+            pass
+    
+    return build_embedding_db()
+
+def get_embedding_db():
+    """Get the embedding matrix matching the faces currently in DB_PATH"""
+    return load_embedding_db(tuple(list_registered_faces()))
+
+@st.cache_resource
+def get_nearest_face_kernel():
+    """JIT-compile the fused similarity and argmax loop once per app process"""
+    @njit(parallel=True, fastmath=True)
+    def kernel(emb_q, scale, probe_q, probe_scale):
+        n, d = emb_q.shape
+        sims = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            acc = 0
+            for j in range(d):
+                acc += np.int32(emb_q[i, j]) * np.int32(probe_q[j])
+            sims[i] = acc / (scale[i] * probe_scale)
+        idx = sims.argmax()
+        return idx, sims[idx]
+    
+    return kernel
+
+def nearest_face(emb_q, scale, probe_q, probe_scale):
+    """Return the index and cosine similarity of the closest stored embedding"""
+    if njit is not None:
+        return get_nearest_face_kernel()(emb_q, scale, probe_q, float(probe_scale))
+    
+    # int8 dot products accumulated in int32, then rescaled to cosine similarity
+    sims = np.einsum('ij,j->i', emb_q, probe_q, dtype=np.int32) / (scale * probe_scale)
+    idx = sims.argmax()
+    return idx, sims[idx]
+
+def dhash(face):
+    """Compute a 64-bit difference hash of an RGB face crop"""
+    gray = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+def lookup_recognition_cache(cache, token, face_hash):
+    """Return the cached name of a near-identical face crop, if any"""
+    # Any change to the embedding matrix invalidates earlier matches
+    if cache.get('token') != token:
+        cache['token'] = token
+        cache['hashes'] = OrderedDict()
+    
+    hashes = cache['hashes']
+    for cached_hash, name in hashes.items():
+        if bin(cached_hash ^ face_hash).count('1') <= HASH_MAX_DISTANCE:
+            hashes.move_to_end(cached_hash)
+            return name
+    return None
+
+def store_recognition_cache(cache, face_hash, name):
+    """Remember a recognized face crop, evicting the least recently used"""
+    hashes = cache['hashes']
+    hashes[face_hash] = name
+    hashes.move_to_end(face_hash)
+    if len(hashes) > HASH_CACHE_SIZE:
+        hashes.popitem(last=False)
 
-def recognize_face(frame):
-    """Recognize face using DeepFace"""
-    if not os.path.exists(DB_PATH) or len(os.listdir(DB_PATH)) == 0:
+def recognize_face(frame, cache=None):
+    """Recognize face using DeepFace, optionally reusing a per-session cache"""
+    if not os.path.exists(DB_PATH) or len(list_registered_faces()) == 0:
+        return None
+    
+    emb_q, scale, names, token = get_embedding_db()
+    if len(names) == 0:
         return None
-        
-    temp_img = "temp_live.jpg"
-    cv2.imwrite(temp_img, frame)
     
-    files = [f for f in os.listdir(DB_PATH) if f.endswith('.jpg')]
     recognized = None
     
     try:
-        for file in files:
-            db_img_path = os.path.join(DB_PATH, file)
-            try:
-                # Use DeepFace.verify with proper parameters
-                result = DeepFace.verify(
-                    img1_path=temp_img, 
-                    img2_path=db_img_path, 
-                    enforce_detection=False,
-                    model_name='VGG-Face'  # Specify model for consistency
-                )
-                
-                if result["verified"]:
-                    recognized = os.path.splitext(file)[0]
-                    break
-                    
-            except Exception as e:
-                st.warning(f"Recognition error with {file}: {str(e)}")
-                continue
+        face = crop_face(frame)
+        
+        # Re-verifying the same (or a nearly identical) face skips the model
+        if cache is not None:
+            face_hash = dhash(face)
+            recognized = lookup_recognition_cache(cache, token, face_hash)
+            if recognized is not None:
+                return recognized
+        
+        # Single forward pass for the probe, compared against every stored embedding
+        probe = embed_faces(np.expand_dims(face, 0))[0]
+        probe_q, probe_scale = quantize_embeddings(probe)
+        idx, similarity = nearest_face(emb_q, scale, probe_q, probe_scale)
+        
+        if similarity >= COSINE_THRESHOLD:
+            recognized = str(names[idx])
+            if cache is not None:
+                store_recognition_cache(cache, face_hash, recognized)
                 
     except Exception as e:
         st.error(f"Overall recognition error: {str(e)}")
     
-    finally:
-        if os.path.exists(temp_img):
-            os.remove(temp_img)
-    
     return recognized
 
 def add_face():
@@ -122,39 +537,77 @@ def add_face():
     
     if st.session_state.capture_face:
         with st.spinner("Accessing webcam..."):
-            cam = cv2.VideoCapture(0)
-            if not cam.isOpened():
+            grabber = get_frame_grabber()
+            if not grabber.cam.isOpened():
+                reset_frame_grabber()
                 st.error("❌ Failed to access webcam.")
                 st.session_state.capture_face = False
                 return
                 
-            ret, frame = cam.read()
-            cam.release()
+            frame = grabber.read()
             
-            if not ret:
+            if frame is None:
                 st.error("❌ Failed to capture image from webcam.")
                 st.session_state.capture_face = False
                 return
         
-        # Save the captured image
-        filename = os.path.join(DB_PATH, f"{name.strip()}.jpg")
-        cv2.imwrite(filename, frame)
+        # Crop and embed the captured frame directly, before anything touches the disk
+        try:
+            face = crop_face(frame)
+            embedding = embed_faces(np.expand_dims(face, 0))[0]
+        except Exception as e:
+            st.error(f"❌ Failed to compute face embedding: {str(e)}")
+            st.session_state.capture_face = False
+            return
+        
+        # Take an in-memory copy of the current matrix before the new crop
+        # changes the listing; holding the memory map itself would block
+        # replacing its file on Windows
+        db = get_embedding_db()
+        db = (np.array(db[0]),) + db[1:]
+        
+        # Save the face crop losslessly, replacing any legacy image, and its embedding
+        filename = os.path.join(DB_PATH, f"{name.strip()}.npy")
+        try:
+            np.save(filename, face)
+            legacy_filename = os.path.join(DB_PATH, f"{name.strip()}.jpg")
+            if os.path.exists(legacy_filename):
+                os.remove(legacy_filename)
+            scan_registered_faces.clear()
+            add_to_embedding_db(name.strip(), embedding, db)
+        except Exception as e:
+            st.error(f"❌ Failed to save face registration: {str(e)}")
+            st.session_state.capture_face = False
+            return
         
         # Display captured image
         st.image(frame, channels="BGR", caption=f"Registered image for {name.strip()}", width=300)
         st.success(f"✅ Face successfully registered for **{name.strip()}**!")
-        st.info(f"📁 Image saved as: {filename}")
+        st.info(f"📁 Face crop saved as: {filename}")
         
         # Reset the capture state
         st.session_state.capture_face = False
         st.session_state.face_name = ""
 
+def display_frame(state, frame):
+    """Downscale a frame to DISPLAY_WIDTH into the session's reusable scratch buffer"""
+    h, w = frame.shape[:2]
+    size = (DISPLAY_WIDTH, round(h * DISPLAY_WIDTH / w))
+    
+    scratch = state.get('scratch')
+    if scratch is None or scratch.shape != (size[1], size[0]) + frame.shape[2:]:
+        scratch = np.empty((size[1], size[0]) + frame.shape[2:], dtype=frame.dtype)
+        state['scratch'] = scratch
+    
+    cv2.resize(frame, size, dst=scratch, interpolation=cv2.INTER_AREA)
+    return scratch
+
 def webcam_verification(check_type):
     """Perform webcam-based face verification"""
     st.subheader(f"🎯 {check_type} Verification")
     
     # Check if any faces are registered
-    if not os.path.exists(DB_PATH) or len([f for f in os.listdir(DB_PATH) if f.endswith('.jpg')]) == 0:
+    if not os.path.exists(DB_PATH) or len(list_registered_faces()) == 0:
         st.warning("⚠️ No registered faces found! Please register a face first.")
         return
     
@@ -164,21 +617,22 @@ def webcam_verification(check_type):
         st.session_state[session_key] = {
             'frame': None,
             'verification_done': False,
-            'last_capture_time': None
+            'last_capture_time': None,
+            'scratch': None
         }
     
     # Capture new frame button
     if st.button(f"📹 Capture Frame for {check_type}", key=f"capture_{check_type}"):
         with st.spinner("Capturing frame..."):
-            cam = cv2.VideoCapture(0)
-            if not cam.isOpened():
+            grabber = get_frame_grabber()
+            if not grabber.cam.isOpened():
+                reset_frame_grabber()
                 st.error("❌ Webcam access problem. Please check your camera.")
                 return
                 
-            ret, frame = cam.read()
-            cam.release()
+            frame = grabber.read()
             
-            if ret:
+            if frame is not None:
                 st.session_state[session_key]['frame'] = frame
                 st.session_state[session_key]['verification_done'] = False
                 st.session_state[session_key]['last_capture_time'] = datetime.now()
@@ -193,7 +647,7 @@ def webcam_verification(check_type):
             st.session_state[session_key]['frame'], 
             channels="BGR", 
             caption=f"Captured frame for {check_type}", 
-            width=400
+            width=DISPLAY_WIDTH
         )
         
         # Show capture time
@@ -207,21 +661,24 @@ def webcam_verification(check_type):
             if st.button(f"🔍 Verify & {check_type}", key=f"verify_{check_type}", type="primary"):
                 with st.spinner("🔍 Analyzing face..."):
                     try:
-                        name = recognize_face(st.session_state[session_key]['frame'])
+                        name = recognize_face(
+                            st.session_state[session_key]['frame'],
+                            cache=st.session_state[session_key].setdefault('recognition_cache', {})
+                        )
                         
                         if name:
                             # Success - Face recognized
                             st.success(f"🎉 **Face verified successfully!**")
                             st.success(f"👤 Welcome, **{name}**!")
                             
-                            # Add success overlay to frame
-                            success_frame = st.session_state[session_key]['frame'].copy()
-                            cv2.putText(success_frame, f"{check_type} - {name}", (20, 40),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                            cv2.putText(success_frame, "VERIFIED", (20, 80),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                            # Add success overlay to a display-sized copy of the frame
+                            success_frame = display_frame(st.session_state[session_key], st.session_state[session_key]['frame'])
+                            cv2.putText(success_frame, f"{check_type} - {name}", (12, 25),
+                                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                            cv2.putText(success_frame, "VERIFIED", (12, 50),
+                                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                             
-                            st.image(success_frame, channels="BGR", caption=f"✅ {check_type} verified for {name}", width=400)
+                            st.image(success_frame, channels="BGR", caption=f"✅ {check_type} verified for {name}", width=DISPLAY_WIDTH)
                             
                             # Log the attendance
                             if log_check(name, check_type):
@@ -235,12 +692,12 @@ def webcam_verification(check_type):
                             st.write("• Remove glasses/masks if worn during registration")
                             st.write("• Check if your face is registered")
                             
-                            # Add failure overlay to frame
-                            fail_frame = st.session_state[session_key]['frame'].copy()
-                            cv2.putText(fail_frame, "NOT RECOGNIZED", (20, 40),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                            # Add failure overlay to a display-sized copy of the frame
+                            fail_frame = display_frame(st.session_state[session_key], st.session_state[session_key]['frame'])
+                            cv2.putText(fail_frame, "NOT RECOGNIZED", (12, 25),
+                                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
                             
-                            st.image(fail_frame, channels="BGR", caption="❌ Face not recognized", width=400)
+                            st.image(fail_frame, channels="BGR", caption="❌ Face not recognized", width=DISPLAY_WIDTH)
                             
                     except Exception as e:
                         st.error(f"❌ Verification failed: {str(e)}")
@@ -258,7 +715,8 @@ def webcam_verification(check_type):
                 st.session_state[session_key] = {
                     'frame': None,
                     'verification_done': False,
-                    'last_capture_time': None
+                    'last_capture_time': None,
+                    'scratch': None
                 }
                 st.rerun()
     
@@ -269,7 +727,7 @@ def display_attendance_log():
     """Display attendance log from JSON file"""
     st.subheader("📊 Attendance Log")
     
-    df = load_attendance_data()
+    records, df = load_attendance_data()
     
     if not df.empty:
         # Display summary statistics
@@ -280,8 +738,10 @@ def display_attendance_log():
             unique_people = df['Name'].nunique() if 'Name' in df.columns else 0
             st.metric("Unique People", unique_people)
         with col3:
-            today = datetime.now().strftime('%Y-%m-%d')
-            today_records = len(df[df['Time'].str.startswith(today)]) if 'Time' in df.columns else 0
+            # Time is sorted with unparsable (NaT) entries last, so today's
+            # records are the valid timestamps after midnight
+            today_start = np.datetime64(pd.Timestamp(datetime.now().date()))
+            today_records = df['Time'].notna().sum() - np.searchsorted(df['Time'].values, today_start) if 'Time' in df.columns else 0
             st.metric("Today's Records", today_records)
         
         st.markdown("---")
@@ -300,14 +760,14 @@ def display_attendance_log():
         # Option to download the data
         st.download_button(
             label="💾 Download Attendance Data (JSON)",
-            data=json.dumps(df.to_dict('records'), indent=4),
+            data=dump_json(records, indent=True),
             file_name=f"attendance_log_{datetime.now().strftime('%Y%m%d')}.json",
             mime="application/json"
         )
         
         # Display raw JSON (expandable)
         with st.expander("🔍 View Raw JSON Data"):
-            st.json(df.to_dict('records'))
+            st.json(records)
     else:
         st.info("📝 No attendance records found. Start by registering faces and logging attendance!")
 
@@ -318,6 +778,8 @@ st.set_page_config(
     layout="wide"
 )
 
+migrate_attendance_data()
+
 st.title("🎯 Face Recognition Attendance System")
 st.markdown("**Powered by elitehemanth**")
 
@@ -355,18 +817,18 @@ with tab2:
 with st.sidebar:
     st.header("ℹ️ App Information")
     st.write("**Face Database:**", DB_PATH)
-    st.write("**Data Storage:**", JSON_FILE)
+    st.write("**Data Storage:**", LOG_FILE)
     
     # Display registered faces count
     if os.path.exists(DB_PATH):
-        face_count = len([f for f in os.listdir(DB_PATH) if f.endswith('.jpg')])
+        registered = list_registered_faces()
+        face_count = len(registered)
         st.metric("Registered Faces", face_count)
     
     if face_count > 0:
         st.write("**Registered Users:**")
-        for f in os.listdir(DB_PATH):
-            if f.endswith('.jpg'):
-                st.write(f"• {os.path.splitext(f)[0]}")
+        for name in registered:
+            st.write(f"• {name}")
     
     st.markdown("---")
     st.markdown("**Features:**")